@@ -6,7 +6,10 @@ from units import *
 import time
 import numpy as np
 from scipy import integrate
-from scipy import fftpack
+try:
+    import scipy.fft as fftpack
+except ImportError:
+    import scipy.fftpack as fftpack
 
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
@@ -83,7 +86,7 @@ if False:
     plt.figure()
     plt.plot(cross_check[:,0], cross_check[:,1], label="Cross-Check from DocDB 16856, Slide 5\n$\O=2.3\,\mathrm{mm}$, $L=15\,\mathrm{mm}$, turns=30", color="orange")
     B_rf_z_0 = nmr_coil.B_field(0, 0, 0)[2]
-    plt.plot(zs/mm, [nmr_coil.B_field(0, 0, z)[2] / B_rf_z_0 for z in zs], label="My calculation\n$\O=4.6\,\mathrm{mm}$, $L=15\,\mathrm{mm}$, turns=30", color="k", ls=":")
+    plt.plot(zs/mm, nmr_coil.B_field(np.zeros_like(zs), np.zeros_like(zs), zs)[2] / B_rf_z_0, label="My calculation\n$\O=4.6\,\mathrm{mm}$, $L=15\,\mathrm{mm}$, turns=30", color="k", ls=":")
     plt.xlabel("z / mm")
     plt.ylabel("$B_z(0,0,z)\, /\, B_z(0,0,0)$")
     plt.legend(loc="lower right")
@@ -3,7 +3,10 @@ import numpy as np
 from scipy.optimize import minimize
 from scipy.stats import linregress
 from scipy.ndimage.filters import uniform_filter1d
-from scipy.fftpack import fft, ifft, fftfreq
+try:
+    from scipy.fft import fft, ifft, fftfreq
+except ImportError:
+    from scipy.fftpack import fft, ifft, fftfreq
 from ..units import *
 from .hilbert_transform import HilbertTransform
 import copy
@@ -46,6 +49,7 @@ class PhaseFitFID(object):
         self.n_smooth = n_smooth
         self.nParams = self.fit_version[fit_mode]["nParams"]
         self.fit_func = self.fit_version[fit_mode]["func"]
+        self.phase_template = None
         if phase_template_file is not None:
             self.load_phase_template(phase_template_file)
         if fit_range_template_file is not None:
@@ -116,7 +120,7 @@ class PhaseFitFID(object):
         else:
             self.phase = self.phase_raw[:]
 
-        if hasattr(self, "phase_template"):
+        if self.phase_template is not None:
             self.phase -= self.phase_template[probe_id]
 
         self.res = self.chi2_fit()
@@ -237,17 +241,19 @@ class PhaseFitRan(object):
 
     def phase_from_fft(self, time, flux, WindowFilterLow=0., WindowFilterHigh=200000.):
         # identical to hilbert except the filter line
-        freq = fftfreq(len(flux), d=np.diff(time)[0]/s)
-        fid_fft_filtered = fft(flux)
-        fid_fft_filtered[np.logical_not(np.logical_and(WindowFilterLow<=np.abs(freq), np.abs(freq)<=WindowFilterHigh))] = 0+0j
-        filtered_wf = np.real(ifft(fid_fft_filtered))
-        wf_im = np.real(ifft(fid_fft_filtered*(-1j)*np.sign(freq)))
+        # flux can be a single FID or an array of shape (N_FIDs, len(time)),
+        # in which case all FIDs are transformed with one FFT call
+        freq = fftfreq(np.shape(flux)[-1], d=np.diff(time)[0]/s)
+        fid_fft_filtered = fft(flux, axis=-1)
+        fid_fft_filtered[..., np.logical_not(np.logical_and(WindowFilterLow<=np.abs(freq), np.abs(freq)<=WindowFilterHigh))] = 0+0j
+        filtered_wf = np.real(ifft(fid_fft_filtered, axis=-1))
+        wf_im = np.real(ifft(fid_fft_filtered*(-1j)*np.sign(freq), axis=-1))
 
         phi = np.arctan2(wf_im, filtered_wf)
         env = np.sqrt(filtered_wf**2 + wf_im**2)
-        jump = 1*(phi[:-1] - phi[1:] > 4.71)
-        jump -= 1*(phi[1:] - phi[:-1] > 4.71)
-        phi += np.concatenate([[0], 2*np.pi*np.cumsum(jump)])
+        jump = 1*(phi[..., :-1] - phi[..., 1:] > 4.71)
+        jump -= 1*(phi[..., 1:] - phi[..., :-1] > 4.71)
+        phi[..., 1:] += 2*np.pi*np.cumsum(jump, axis=-1)
         return filtered_wf, phi, env
 
     def linear_fit(self, x, y, start, stop, NPar):
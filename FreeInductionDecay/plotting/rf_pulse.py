@@ -8,27 +8,30 @@ from mpl_toolkits.axes_grid1.inset_locator import mark_inset
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib import cm as mcolors
 
-from ..units import us
+from ..units import us, mm
 
-def plot_coil_bz():
+def plot_coil_bz(probe, show_cross_check=False, show_analytic_solution=False,
+                 savepath=None, close_on_exit=False):
     # make a plot for comparison
     fig, ax = plt.subplots()
 
-    B_rf_z_0 = nmr_probe.coil.B_field(0, 0, 0)[2]
-    ax.plot(zs/mm, [nmr_probe.coil.B_field(0, 0, z)[2] / B_rf_z_0 for z in zs], label="My calculation\n$\O=4.6\,\mathrm{mm}$, $L=15\,\mathrm{mm}$, turns=30", color="k", ls=":")
+    # the coil field is evaluated for all positions in one call
+    zs = np.linspace(-15*mm, 15*mm, 1000)
+    B_rf_z = probe.coil.B_field(np.zeros_like(zs), np.zeros_like(zs), zs)[2]
+    B_rf_z_0 = probe.coil.B_field(0, 0, 0)[2]
+    ax.plot(zs/mm, B_rf_z / B_rf_z_0, label="My calculation\n$\O=4.6\,\mathrm{mm}$, $L=15\,\mathrm{mm}$, turns=30", color="k", ls=":")
 
     ax.set_xlabel("z / mm")
     ax.set_ylabel("$B_z(0,0,z)\, /\, B_z(0,0,0)$")
-    plt.legend(loc="lower right")
     plt.title("Magnetic field of the coil (static)")
-    fig.tight_layout()
 
     if show_cross_check:
         cross_check = np.genfromtxt("../tests/RF_coil_field_cross_check.txt", delimiter=", ")
-        zs = np.linspace(-15*mm, 15*mm, 1000)
         ax.plot(cross_check[:,0], cross_check[:,1], label="Cross-Check from DocDB 16856, Slide 5\n$\O=2.3\,\mathrm{mm}$, $L=15\,\mathrm{mm}$, turns=30", color="orange")
     if show_analytic_solution:
-        ax.scatter(zs/mm, B_z(zs)/B_z(0), label="Experimentalphysik 2, Demtröder\nSection 3.2.6.d Page 95")
+        ax.scatter(zs/mm, probe.coil.Bz(zs)/probe.coil.Bz(0), label="Experimentalphysik 2, Demtröder\nSection 3.2.6.d Page 95")
+    plt.legend(loc="lower right")
+    fig.tight_layout()
 
     if savepath is not None:
         fig.savefig(savepath.replace("png", "pdf"), bbox_inches="tight")
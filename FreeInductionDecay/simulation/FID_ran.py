@@ -46,6 +46,18 @@ noise, etc.
 # not yet tested
 
 import numpy as np
+from .FID_sim import _pickup_flux_phasor_kernel, _pickup_tile_length
+
+def _cosine_sum(omega, amplitudes, t, out):
+    """out[j] = Re( sum_i amplitudes[i]*exp(1j*omega[i]*t[j]) )
+
+    for equidistant times `t`, evaluated with the phasor kernel of the flux
+    in FID_sim, see `_pickup_flux_phasor_kernel`.
+    """
+    dt = t[1] - t[0]
+    _pickup_flux_phasor_kernel(t, omega, np.exp(1j*omega*dt),
+                               np.asarray(amplitudes, dtype=complex),
+                               _pickup_tile_length(len(t)), out)
 
 class ProbeSimulator(object):
     def __init__(self, ProbeType):
@@ -229,13 +241,14 @@ class ProbeSimulator(object):
 
     def GenerateFid(self):
         self.FidWf = np.zeros(self.fFidSamples)
-        self.FidTime = np.zeros(self.fFidSamples)
-
-        for j in np.arange(self.fPreSamples, self.fFidSamples):
-            t = j * self.fSamplingPeriod + self.fT0
-            self.FidWf[j] = np.sum(np.cos(2 * np.pi * self.fFreqBins * t) * np.exp(-t / self.fT2) * self.fWeightFunction)
         self.FidTime = np.arange(0, self.fFidSamples)*self.fSamplingPeriod + self.fT0
 
+        # the samples before fPreSamples stay zero
+        t = self.FidTime[self.fPreSamples:]
+        _cosine_sum(2 * np.pi * self.fFreqBins, self.fWeightFunction, t,
+                    self.FidWf[self.fPreSamples:])
+        self.FidWf[self.fPreSamples:] *= np.exp(-t / self.fT2)
+
     def GenerateEnvPhase(self):
         DistC = np.zeros(self.fFidSamples)
         DistS = np.zeros(self.fFidSamples)
@@ -243,9 +256,12 @@ class ProbeSimulator(object):
         f0 = self.fBFieldShape[0]
 
         t = np.arange(0, self.fFidSamples)*self.fSamplingPeriod + self.fT0
-        for f, w in zip(self.fFreqBins, self.fWeightFunction):
-        	DistC += np.cos(2 * np.pi * (f-f0) * t) * np.exp(-t / self.fT2) * w
-        	DistS += np.sin(2 * np.pi * (f-f0) * t) * np.exp(-t / self.fT2) * w
+        omega = 2 * np.pi * (self.fFreqBins - f0)
+        # Re(-1j*z) = Im(z) gives the sine sum
+        _cosine_sum(omega, self.fWeightFunction, t, DistC)
+        _cosine_sum(omega, -1j*np.asarray(self.fWeightFunction), t, DistS)
+        DistC *= np.exp(-t / self.fT2)
+        DistS *= np.exp(-t / self.fT2)
 
         self.fEnv = np.sqrt(DistC**2 + DistS**2)
         self.fPhase = np.arctan(DistS/DistC)
@@ -1,8 +1,291 @@
 # -*- coding: utf-8 -*-
 import numpy as np
-from scipy import integrate
+import numba
+from numba import njit, prange
+try:
+    import finufft
+except ImportError:
+    finufft = None
 from ..units import *
 
+# row indices of the per cell quantities in FID_simulation.cells_state
+IX_X = 0
+IX_Y = 1
+IX_Z = 2
+IX_B0_X = 3
+IX_B0_Y = 4
+IX_B0_Z = 5
+IX_B0 = 6
+IX_B1_X = 7
+IX_B1_Y = 8
+IX_B1_Z = 9
+IX_B1 = 10
+IX_MAGNETIZATION = 11
+# mu0*magnetization, the field of the cell per unit of relative magnetization
+IX_MU0_MAGNETIZATION = 12
+N_CELL_FIELDS = 13
+
+# cache sizes used to tile the kernels, typical L1 data cache and L2 size
+_L1_BYTES = 32*1024
+_L2_BYTES = 256*1024
+# number of cells integrated together in the Bloch kernel, such that their
+# state, fields, weight and Runge-Kutta stages (32 float64 each) stay in the
+# L1 cache
+_BLOCH_CELL_BLOCK = _L1_BYTES//(32*8)
+# number of time steps of the Bloch kernel between two reductions of the
+# partial sums of the parallel blocks into the history
+_BLOCH_WINDOW = 4096
+
+@njit(cache=True, fastmath=True)
+def _bloch_rhs(M, out, cells_state, gamma, rf_osci,
+               with_self_contribution, with_relaxation, R1, R2):
+    """Right hand side of the Bloch equations for all cells.
+
+    `M` is the state (Mx, My, Mz) of shape (3, N_cells), the time derivative
+    is written into `out` of the same shape. The fields of the cells are read
+    from the rows of `cells_state`. All constants are passed explicitly, so
+    that the compiled kernel does not depend on the unit system chosen by
+    numericalunits. R1 = 1/T1 and R2 = 1/T2 are the relaxation rates.
+
+    The kernel contains no floating point literals, thus it is evaluated in
+    the precision of its arguments (float32 or float64).
+    """
+    N = cells_state.shape[1]
+    for i in range(N):
+        Mx = M[0, i]
+        My = M[1, i]
+        Mz = M[2, i]
+        Bx = cells_state[IX_B0_X, i] + rf_osci*cells_state[IX_B1_X, i]
+        By = cells_state[IX_B0_Y, i] + rf_osci*cells_state[IX_B1_Y, i]
+        Bz = cells_state[IX_B0_Z, i] + rf_osci*cells_state[IX_B1_Z, i]
+        if with_self_contribution:
+            mag = cells_state[IX_MU0_MAGNETIZATION, i]
+            Bx += mag*Mx
+            By += mag*My
+            Bz += mag*Mz
+        dMx = gamma*(My*Bz-Mz*By)
+        dMy = gamma*(Mz*Bx-Mx*Bz)
+        dMz = gamma*(Mx*By-My*Bx)
+        if with_relaxation:
+            # note we approximate here that the external field is in y direction
+            # in the ideal case we would calculate the B0_field direct and the ortogonal plane
+            # note that we use relative magnetization , so the -1 is -M0
+            dMx -= R2*Mx
+            dMy -= R1*My - R1
+            dMz -= R2*Mz
+        out[0, i] = dMx
+        out[1, i] = dMy
+        out[2, i] = dMz
+
+@njit(cache=True)
+def _record_bloch_state(sums, center, n, M, weights, central_cell):
+    """Adds the weighted sums of Mx, My, Mz to sums[n] and stores the state
+    of the central cell in center[n], if it is one of the cells in M."""
+    for k in range(3):
+        acc = 0.
+        for i in range(M.shape[1]):
+            acc += weights[i]*M[k, i]
+        sums[n, k] += acc
+        if central_cell >= 0:
+            center[n, k] = M[k, central_cell]
+
+@njit(cache=True, fastmath=True)
+def _rk_stage(out, M, h, k):
+    """out = M + h*k without temporary arrays"""
+    for c in range(3):
+        for i in range(M.shape[1]):
+            out[c, i] = M[c, i] + h*k[c, i]
+
+@njit(cache=True, fastmath=True)
+def _rk_update(M, h6, h3, k1, k2, k3, k4):
+    """M += h6*(k1 + k4) + h3*(k2 + k3) in place, i.e. the final RK4 step"""
+    for c in range(3):
+        for i in range(M.shape[1]):
+            M[c, i] += h6*(k1[c, i] + k4[c, i]) + h3*(k2[c, i] + k3[c, i])
+
+@njit(cache=True, fastmath=True)
+def _integrate_bloch_cells(M, cells_state, h, rf, n_steps, gamma,
+                           with_self_contribution, with_relaxation, R1, R2,
+                           weights, central_cell, sums, center):
+    """Runge-Kutta 4 integration of the cells in `M` over the first `n_steps`
+    time steps of `rf`, the state after step n is recorded in sums[n] and
+    center[n], see `_integrate_bloch`."""
+    k1 = np.empty_like(M)
+    k2 = np.empty_like(M)
+    k3 = np.empty_like(M)
+    k4 = np.empty_like(M)
+    tmp = np.empty_like(M)
+    for n in range(n_steps):
+        _bloch_rhs(M, k1, cells_state, gamma, rf[n, 0],
+                   with_self_contribution, with_relaxation, R1, R2)
+        _rk_stage(tmp, M, h[0], k1)
+        _bloch_rhs(tmp, k2, cells_state, gamma, rf[n, 1],
+                   with_self_contribution, with_relaxation, R1, R2)
+        _rk_stage(tmp, M, h[0], k2)
+        _bloch_rhs(tmp, k3, cells_state, gamma, rf[n, 1],
+                   with_self_contribution, with_relaxation, R1, R2)
+        _rk_stage(tmp, M, h[1], k3)
+        _bloch_rhs(tmp, k4, cells_state, gamma, rf[n, 2],
+                   with_self_contribution, with_relaxation, R1, R2)
+        _rk_update(M, h[2], h[3], k1, k2, k3, k4)
+        _record_bloch_state(sums, center, n, M, weights, central_cell)
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _integrate_bloch(M, n_steps, dt, cells_state, gamma, omega_rf,
+                     phase_rf, with_rf, with_self_contribution,
+                     with_relaxation, R1, R2, weights, central_cell,
+                     n_blocks, sub_block, window):
+    """Integrates the Bloch equations with a fixed step Runge-Kutta 4 method.
+
+    The state `M` of shape (3, N_cells) is updated in place. Returns the
+    history of shape (n_steps+1, 7) with the columns time, weighted mean of
+    Mx, My, Mz and Mx, My, Mz of the central cell.
+
+    The cells evolve independently of each other. They are split into
+    `n_blocks` blocks, which are integrated in parallel, each block sums its
+    contribution to the weighted means separately. Within a block groups of
+    `sub_block` cells are copied to contiguous arrays and integrated, such
+    that they stay in the L1 cache. The time steps are processed in windows
+    of `window` steps, after each window the partial sums of the blocks are
+    reduced into the history. Thus the memory of the RF table and of the
+    partial sums does not grow with the number of steps.
+
+    The state, `cells_state` and the constants gamma, R1 and R2 have to
+    share one floating point type, which is used for the integration. The
+    time, the phase of the RF pulse and the history are always float64.
+    """
+    N = M.shape[1]
+    # step sizes and RF amplitudes in the floating point type of M
+    h = np.empty(4, dtype=M.dtype)
+    h[0] = 0.5*dt
+    h[1] = dt
+    h[2] = dt/6.
+    h[3] = dt/3.
+
+    history = np.empty((n_steps+1, 7))
+    initial = np.zeros((1, 3))
+    initial_center = np.zeros((1, 3))
+    _record_bloch_state(initial, initial_center, 0, M, weights, central_cell)
+    history[0, 0] = 0.
+    for k in range(3):
+        history[0, 1+k] = initial[0, k]/N
+        history[0, 4+k] = initial_center[0, k]
+
+    block = (N + n_blocks - 1)//n_blocks
+    # RF amplitude at the beginning, the middle and the end of each step
+    rf = np.zeros((window, 3), dtype=M.dtype)
+    sums = np.empty((n_blocks, window, 3))
+    center = np.zeros((window, 3))
+    for first in range(0, n_steps, window):
+        n_window = min(window, n_steps - first)
+        if with_rf:
+            for n in range(n_window):
+                t = (first + n)*dt
+                rf[n, 0] = np.sin(omega_rf*t+phase_rf)
+                rf[n, 1] = np.sin(omega_rf*(t+0.5*dt)+phase_rf)
+                rf[n, 2] = np.sin(omega_rf*(t+dt)+phase_rf)
+        sums[:] = 0.
+        for b in prange(n_blocks):
+            for start in range(b*block, min((b+1)*block, N), sub_block):
+                stop = min(start + sub_block, (b+1)*block, N)
+                M_sub = np.ascontiguousarray(M[:, start:stop])
+                central_sub = central_cell - start if start <= central_cell < stop else -1
+                _integrate_bloch_cells(M_sub,
+                                       np.ascontiguousarray(cells_state[:, start:stop]),
+                                       h, rf, n_window, gamma,
+                                       with_self_contribution, with_relaxation,
+                                       R1, R2,
+                                       np.ascontiguousarray(weights[start:stop]),
+                                       central_sub, sums[b], center)
+                M[:, start:stop] = M_sub
+
+        for n in range(n_window):
+            history[first+n+1, 0] = (first+n+1)*dt
+            for k in range(3):
+                acc = 0.
+                for b in range(n_blocks):
+                    acc += sums[b, n, k]
+                history[first+n+1, 1+k] = acc/N
+                history[first+n+1, 4+k] = center[n, k]
+    return history
+
+# number of cells (five float64 each) per block of the direct flux kernel,
+# such that a block stays in half of the L2 cache while looping over time
+_PICKUP_CELL_BLOCK = _L2_BYTES//(2*5*8)
+
+def _pickup_tile_length(N_t):
+    """Length of the time tiles of the phasor flux kernel.
+
+    The accumulator of one tile (float64) should use at most half of the L1
+    cache, while there should be enough tiles to keep all threads busy.
+    """
+    per_thread = -(-N_t//numba.get_num_threads())
+    return max(64, min(_L1_BYTES//16, per_thread))
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _pickup_flux_kernel(t, omega, phase, mag, wx, wz, block, out):
+    """Sums the induced flux of all cells for every time in `t`.
+
+    out[j] = sum_i mag[i]*(wx[i]*cos(a) + wz[i]*sin(a)),  a = omega[i]*t[j] - phase[i]
+
+    No (N_cells, N_times) intermediate array is created. The cells are processed
+    in blocks of `block` cells, which stay cache resident while looping over
+    all times.
+    """
+    N = omega.shape[0]
+    out[:] = 0.
+    for start in range(0, N, block):
+        stop = min(start + block, N)
+        for j in prange(t.shape[0]):
+            acc = 0.
+            for i in range(start, stop):
+                a = omega[i]*t[j] - phase[i]
+                acc += mag[i]*(wx[i]*np.cos(a) + wz[i]*np.sin(a))
+            out[j] += acc
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _pickup_flux_phasor_kernel(t, omega, rotation, cplx, tile, out):
+    """Sums the induced flux of all cells on an equidistant time grid `t`.
+
+    out[j] = Re( sum_i cplx[i]*exp(1j*omega[i]*t[j]) )
+
+    The time axis is split into tiles of length `tile`. At the beginning of
+    each tile the phasor of every cell is evaluated exactly, inside the tile
+    it is advanced by multiplication with rotation[i] = exp(1j*omega[i]*dt).
+    Thus only one complex exponential per cell and tile is needed.
+    """
+    N = omega.shape[0]
+    N_t = t.shape[0]
+    N_tiles = (N_t + tile - 1)//tile
+    for k in prange(N_tiles):
+        start = k*tile
+        stop = min(start + tile, N_t)
+        for j in range(start, stop):
+            out[j] = 0.
+        for i in range(N):
+            z = cplx[i]*np.exp(1j*omega[i]*t[start])
+            r = rotation[i]
+            for j in range(start, stop):
+                out[j] += z.real
+                z *= r
+
+# the flux is calculated with a non uniform FFT (if finufft is installed) for
+# more than this number of (cell, time) pairs, at the given relative precision
+_NUFFT_MIN_WORK = 1000000
+_NUFFT_EPS = 1e-12
+
+def _pickup_flux_nufft(t, omega, cplx, out):
+    """Sums the induced flux of all cells for every time in `t`.
+
+    out[j] = Re( sum_i cplx[i]*exp(1j*omega[i]*t[j]) )
+
+    The sum is a non uniform discrete Fourier transform from the frequencies
+    `omega` to the times `t` (type 3 NUFFT), which costs
+    O((N_cells + N_times) log(1/eps)) instead of O(N_cells*N_times).
+    """
+    out[:] = finufft.nufft1d3(omega, cplx.astype(np.complex128), t,
+                              isign=1, eps=_NUFFT_EPS).real
+
 class UnitVectorArray(object):
     """This class helps keeping track of different coordinate systems.
     The class has implemented these two systems by now
@@ -52,11 +335,47 @@ class UnitVectorArray(object):
         self._y = L
         self._z = T*np.sin(phase)
 
+def _cells_row(index):
+    """Property giving access to one row of FID_simulation.cells_state"""
+    def get_row(self):
+        return self.cells_state[index]
+    def set_row(self, value):
+        self.cells_state[index] = value
+    return property(get_row, set_row)
+
 class FID_simulation(object):
+    # per cell quantities are stored as rows of the array `cells_state` of
+    # shape (N_CELL_FIELDS, N_cells), such that compiled kernels can stream
+    # through a single contiguous block of memory
+    cells_x = _cells_row(IX_X)
+    cells_y = _cells_row(IX_Y)
+    cells_z = _cells_row(IX_Z)
+    cells_B0_x = _cells_row(IX_B0_X)
+    cells_B0_y = _cells_row(IX_B0_Y)
+    cells_B0_z = _cells_row(IX_B0_Z)
+    cells_B0 = _cells_row(IX_B0)
+    cells_B1_x = _cells_row(IX_B1_X)
+    cells_B1_y = _cells_row(IX_B1_Y)
+    cells_B1_z = _cells_row(IX_B1_Z)
+    cells_B1 = _cells_row(IX_B1)
+
+    @property
+    def cells_magnetization(self):
+        return self.cells_state[IX_MAGNETIZATION]
+
+    @cells_magnetization.setter
+    def cells_magnetization(self, value):
+        # the self contribution to the field in the Bloch equations is kept
+        # precomputed next to the magnetization
+        self.cells_state[IX_MAGNETIZATION] = value
+        self.cells_state[IX_MU0_MAGNETIZATION] = mu0*self.cells_state[IX_MAGNETIZATION]
+
     def __init__(self, probe, b_field, N_cells, seed):
         self.B_field = b_field
         self.probe = probe
-        self.rng = np.random.RandomState(seed)
+        self.rng = np.random.default_rng(seed)
+        # T2 envelope of the last time series passed to generate_FID
+        self._envelope = None
 
         self.initialize_cells(N_cells)
         # by initializing we want to start in equalibrium
@@ -71,29 +390,34 @@ class FID_simulation(object):
         """
         # initialize cells
         self.N_cells = N_cells
+        self.cells_state = np.empty((N_CELL_FIELDS, N_cells))
         self.cells_x, self.cells_y, self.cells_z = self.probe.random_samples(self.rng, N_cells)
 
         # calculate external field at cell
-        B0 = np.array([self.B_field(x, y, z) for x, y, z in zip(self.cells_x, self.cells_y, self.cells_z)])
-        self.cells_B0_x = B0[:,0]
-        self.cells_B0_y = B0[:,1]
-        self.cells_B0_z = B0[:,2]
-        self.cells_B0 = np.sqrt(np.sum(B0**2, axis=-1))
+        Bx, By, Bz = self.B_field(self.cells_x, self.cells_y, self.cells_z)
+        self.cells_B0_x = Bx
+        self.cells_B0_y = By
+        self.cells_B0_z = Bz
+        self.cells_B0 = np.sqrt(Bx*Bx + By*By + Bz*Bz)
 
         # calculate coil field at cell
-        B1 = np.array([self.probe.coil.B_field(x, y, z) for x, y, z in zip(self.cells_x, self.cells_y, self.cells_z)])
-        self.cells_B1_x = B1[:,0]
-        self.cells_B1_y = B1[:,1]
-        self.cells_B1_z = B1[:,2]
-        self.cells_B1 = np.sqrt(np.sum(B1**2, axis=-1))
+        Bx, By, Bz = self.probe.coil.B_field_many(self.cells_x, self.cells_y, self.cells_z)
+        self.cells_B1_x = Bx
+        self.cells_B1_y = By
+        self.cells_B1_z = Bz
+        self.cells_B1 = np.sqrt(Bx*Bx + By*By + Bz*Bz)
 
         # calculate magnetization of cells
         # dipoles are aligned with the external field at the beginning
         # that is the amplitude not the orientation
         self.cells_magnetization = self.probe.magnetization(self.cells_B0)
 
+        # precession frequency of the cells, which only depends on the
+        # external field, see generate_FID
+        self._omega = self.probe.material.gyromagnetic_ratio*self.cells_B0
+
     def frequency_spectrum(self):
-        omega_mixed = (self.probe.material.gyromagnetic_ratio*self.cells_B0-2*np.pi*self.probe.mix_down)
+        omega_mixed = self._omega - 2*np.pi*self.probe.mix_down
         weights = np.sqrt(self.cells_B1_x**2+self.cells_B1_z**2)*self.cells_mu.T
         return omega_mixed, weights/np.mean(weights)
 
@@ -106,7 +430,8 @@ class FID_simulation(object):
         return np.sqrt(np.average((f-self.mean_frequency())**2, weights=w))
 
     def central_frequency(self):
-        B0 = np.sqrt(np.sum(np.array(self.B_field(0, 0, 0))**2, axis=-1))
+        Bx, By, Bz = self.B_field(0, 0, 0)
+        B0 = np.sqrt(Bx*Bx + By*By + Bz*Bz)
         return (self.probe.material.gyromagnetic_ratio*B0-2*np.pi*self.probe.mix_down)
 
     def equalibrium(self):
@@ -182,6 +507,8 @@ class FID_simulation(object):
         # Return typ is different. pickup_flux only returned flux and expected a
         # time series, while generate_FID can default to a time series and Returns
         # both flux and time series
+        # max_memory is kept for backwards compatibility only, the flux kernels
+        # do not allocate (N_cells, N_times) arrays any more
         (r"""
         # Φ(t) = Σ N B₂(r) * μ(t) / I
         # a mix down_frequency can be propergated through and will effect the
@@ -240,27 +567,43 @@ class FID_simulation(object):
             N_pre =  int(self.probe.time_pretrigger*self.probe.sampling_rate_offline)
             t = t[:-N_pre]
 
-        magnitude = np.sqrt((self.probe.material.gyromagnetic_ratio*self.cells_B0)**2 + 1/self.probe.material.T2**2)
-        omega_mixed = (self.probe.material.gyromagnetic_ratio*self.cells_B0-2*np.pi*self.probe.mix_down)
+        self._precompute_pickup_weights()
+        T2 = self.probe.material.T2
+        coil = self.probe.coil
 
-        flux = []
-        chunks = int(self.N_cells* len(t) / max_memory + 1)
+        # on an equidistant time grid the phasors of the cells can be advanced
+        # by a constant rotation instead of evaluating sin and cos every time
+        equidistant = False
+        if len(t) > 1:
+            dt = t[1] - t[0]
+            equidistant = np.allclose(np.diff(t), dt, rtol=1e-9, atol=0)
+            rotation = np.exp(1j*self._omega_mixed*dt)
+
+        # the state of the cells is propagated once at the end
         t0 = t[0]
-        for this_t in np.array_split(t, chunks):
-            this_t = this_t - t0
-            argument = np.outer(omega_mixed,this_t) - self.cells_mu.phase[:, None]
-            # this is equal to Bx * dmu_x_dt + By * dmu_y_dt + Bz * dmu_z_dt
-            # already assumed that dmu_y_dt is 0, so we can leave out that term
-            weight_x = self.cells_B1_x/np.mean(self.cells_B1)
-            weight_z = self.cells_B1_z/np.mean(self.cells_B1)
-            B_x_dmu_dt = self.cells_mu.T[:, None]*magnitude[:, None]*(weight_x[:, None]*np.cos(argument) + weight_z[:, None]*np.sin(argument))*(np.exp(-this_t/self.probe.material.T2)[:, None]).T
-            #return self.coil.turns * mu0 * np.sum(B_x_dmu_dt/self.cells_B1[:, None]*self.cells_magnetization[:, None], axis=0) * np.pi * self.coil.radius**2
-            flux.append(self.probe.coil.turns * mu0 * np.sum(B_x_dmu_dt*self.cells_magnetization[:, None], axis=0) * np.pi * self.probe.coil.radius**2)
-            t0 += this_t[-1]
-            self.cells_mu.set_L_T_phase(self.cells_mu.L,
-                                        self.cells_mu.T * np.exp(-this_t[-1]/self.probe.material.T2),
-                                        self.cells_mu.phase - omega_mixed*this_t[-1])
-        flux = np.concatenate(flux)/self.N_cells
+        this_t = t - t0
+        # this is equal to Bx * dmu_x_dt + By * dmu_y_dt + Bz * dmu_z_dt
+        # already assumed that dmu_y_dt is 0, so we can leave out that term
+        B_x_dmu_dt = np.empty(len(this_t))
+        if finufft is not None and self.N_cells*len(this_t) > _NUFFT_MIN_WORK:
+            _pickup_flux_nufft(this_t, self._omega_mixed, self._pickup_cplx,
+                               B_x_dmu_dt)
+        elif equidistant:
+            _pickup_flux_phasor_kernel(this_t, self._omega_mixed, rotation,
+                                       self._pickup_cplx,
+                                       _pickup_tile_length(len(this_t)),
+                                       B_x_dmu_dt)
+        else:
+            _pickup_flux_kernel(this_t, self._omega_mixed, self._phase,
+                                self._mag, self._wx, self._wz,
+                                _PICKUP_CELL_BLOCK, B_x_dmu_dt)
+        B_x_dmu_dt *= self._relaxation_envelope(this_t, T2)
+        flux = coil.turns * mu0 * B_x_dmu_dt * np.pi * coil.radius**2
+        delta_t = t[-1] - t0
+        self.cells_mu.set_L_T_phase(self.cells_mu.L,
+                                    self.cells_mu.T * np.exp(-delta_t/T2),
+                                    self._phase - self._omega_mixed*delta_t)
+        flux /= self.N_cells
 
         if pretrigger:
             N_pre =  int(self.probe.time_pretrigger*self.probe.sampling_rate_offline)
@@ -271,8 +614,46 @@ class FID_simulation(object):
             flux += FID_noise
         return flux, t
 
+    def _relaxation_envelope(self, t, T2):
+        """Returns exp(-t/T2). The envelope is kept for the next call, such
+        that repeated calls of `generate_FID` on the same time series do not
+        evaluate the exponential again.
+        """
+        if self._envelope is not None:
+            cached_t, cached_T2, envelope = self._envelope
+            if cached_T2 == T2 and np.array_equal(cached_t, t):
+                return envelope
+        envelope = np.exp(-t/T2)
+        self._envelope = (t.copy(), T2, envelope)
+        return envelope
+
+    def _precompute_pickup_weights(self):
+        """Calculates the per cell quantities entering the induced flux in
+        `generate_FID` for the current state of the cells.
+
+        Sets:
+        * _omega_mixed: mixed down precession frequency of the cells
+        * _phase: phase of the cells in the transversal plane
+        * _mag: amplitude of d/dt mu, weighted with the magnetization of the cell
+        * _wx, _wz: coil field of the cell relative to the mean coil field
+        * _pickup_cplx: complex amplitude of the cell, such that
+              _mag*(_wx*cos(a) + _wz*sin(a)) = Re(_pickup_cplx*exp(1j*_omega_mixed*t))
+          with a = _omega_mixed*t - _phase
+        """
+        self._omega_mixed = self._omega - 2*np.pi*self.probe.mix_down
+        self._phase = self.cells_mu.phase
+        # amplitude factor of d/dt mu, T2 is taken from the material at every
+        # call, like the envelope in generate_FID
+        T2 = self.probe.material.T2
+        magnitude = np.sqrt(self._omega**2 + 1/T2**2)
+        self._mag = self.cells_mu.T*magnitude*self.cells_magnetization
+        mean_B1 = np.mean(self.cells_B1)
+        self._wx = self.cells_B1_x/mean_B1
+        self._wz = self.cells_B1_z/mean_B1
+        self._pickup_cplx = self._mag*(self._wx - 1j*self._wz)*np.exp(-1j*self._phase)
+
     # rename bloch equation
-    def solve_bloch_eq_nummerical(self, time=None, initial_condition=None, omega_rf=2*np.pi*61.79*MHz, with_relaxation=False, time_step=1.*ns, with_self_contribution=True, phase_rf=0):
+    def solve_bloch_eq_nummerical(self, time=None, initial_condition=None, omega_rf=2*np.pi*61.79*MHz, with_relaxation=False, time_step=0.1*ns, with_self_contribution=True, phase_rf=0, dtype=np.float64):
         (r"""Solves the Bloch Equation numerically for a RF pulse with length `time`
         and frequency `omega_rf`.
 
@@ -292,13 +673,22 @@ class FID_simulation(object):
             * with_relaxation: If true the relaxation terms are considered in the
                     Bloch equations. If false the relaxation terms are neglected.
                     Default: False
-            * time_step: Float, maximal time step used in nummerical solution of
-                    the Differential equation. Note that this value should be
-                    sufficient smaller than the oscillation time scale.
-                    Default: 1 ns
+            * time_step: Float, time step of the fixed step Runge-Kutta
+                    solution of the Differential equation. Note that this value
+                    should be sufficient smaller than the oscillation time scale.
+                    Default: 0.1 ns (about 160 points per oscillation)
             * with_self_contribution: Boolean, if True we consider the additional
                     B-field from the magnetization of the cell.
                     Default: True
+            * dtype: floating point type used for the cell fields and the state
+                    during the integration. np.float32 halves the memory
+                    traffic, but the relative precision of the fields is only
+                    ~1e-7, i.e. the precession frequencies are off by up to
+                    ~0.1 ppm. After a pi/2 pulse the magnetization differs
+                    from the float64 result by up to ~1e-4. The returned
+                    history and the final state of the cells are always
+                    float64.
+                    Default: np.float64
         Returns:
             * history: array of shape (7, N_time_steps)
                        times, mean_Mx, mean_My, mean_Mz, Mx(0,0,0), My(0,0,0), Mz(0,0,0)
@@ -318,51 +708,31 @@ class FID_simulation(object):
             # latest state of mu
             initial_condition = [self.cells_mu.x, self.cells_mu.y, self.cells_mu.z]
 
-        # pulse frequency
-        def Bloch_equation(t, M):
-            M = M.reshape((3, self.N_cells))
-            Mx, My, Mz = M[0], M[1], M[2]
-
-            Bx = self.cells_B0_x
-            By = self.cells_B0_y
-            Bz = self.cells_B0_z
-            if with_self_contribution:
-                Bx = Bx + mu0*self.cells_magnetization*Mx
-                By = By + mu0*self.cells_magnetization*My
-                Bz = Bz + mu0*self.cells_magnetization*Mz
-            if omega_rf is not None:
-                rf_osci = np.sin(omega_rf*t+phase_rf)
-                Bx = Bx + rf_osci * self.cells_B1_x
-                By = By + rf_osci * self.cells_B1_y
-                Bz = Bz + rf_osci * self.cells_B1_z
-            dMx = self.probe.material.gyromagnetic_ratio*(My*Bz-Mz*By)
-            dMy = self.probe.material.gyromagnetic_ratio*(Mz*Bx-Mx*Bz)
-            dMz = self.probe.material.gyromagnetic_ratio*(Mx*By-My*Bx)
-            if with_relaxation:
-                # note we approximate here that the external field is in y direction
-                # in the ideal case we would calculate the B0_field direct and the ortogonal plane
-                # note that we use relative magnetization , so the -1 is -M0
-                dMx -= Mx/self.probe.material.T2
-                dMy -= (My-1)/self.probe.material.T1
-                dMz -= Mz/self.probe.material.T2
-            return np.array([dMx, dMy, dMz]).flatten()
-
-        rk_res = integrate.RK45(Bloch_equation,
-                                t0=0,
-                                y0=np.array(initial_condition).flatten(),
-                                t_bound=time,
-                                max_step=0.1*ns)  # about 10 points per oscillation
-        history = []
+        material = self.probe.material
+        # fixed step size, adjusted such that we end exactly at `time`
+        n_steps = max(1, int(np.ceil(time/time_step)))
+        dt = time/n_steps
 
+        # the kernel integrates in the floating point type of its inputs
+        real = np.dtype(dtype).type
+        M = np.array(initial_condition, dtype=dtype).reshape((3, self.N_cells))
+        weights = self.cells_B1/np.mean(self.cells_B1)
         central_cell = np.argmin(self.cells_x**2 + self.cells_y**2 + self.cells_z**2)
-        M = None
-        while rk_res.status == "running":
-            M = rk_res.y.reshape((3, self.N_cells))
-            Mx, My, Mz = M[0], M[1], M[2]
-            w = self.cells_B1/np.mean(self.cells_B1)
-            history.append((rk_res.t, np.mean(w*Mx), np.mean(w*My), np.mean(w*Mz), Mx[central_cell], My[central_cell], Mz[central_cell]))
-            rk_res.step()
-        M = rk_res.y.reshape((3, self.N_cells))
-        self.cells_mu.set_x_y_z(M[0], M[1], M[2])
-
-        return np.array(history, dtype=[(k, np.float) for k in ["time", "Mx_mean", "My_mean", "Mz_mean", "Mx_center", "My_center", "Mz_center"]])
+        raw_history = _integrate_bloch(M, n_steps, dt,
+                                       self.cells_state.astype(dtype, copy=False),
+                                       real(material.gyromagnetic_ratio),
+                                       0. if omega_rf is None else omega_rf,
+                                       phase_rf, omega_rf is not None,
+                                       with_self_contribution, with_relaxation,
+                                       real(1/material.T1), real(1/material.T2),
+                                       weights, central_cell,
+                                       max(1, min(self.N_cells, numba.get_num_threads())),
+                                       _BLOCH_CELL_BLOCK, _BLOCH_WINDOW)
+        # the state of the cells is kept in float64 independent of `dtype`
+        self.cells_mu.set_x_y_z(*M.astype(np.float64))
+
+        names = ["time", "Mx_mean", "My_mean", "Mz_mean", "Mx_center", "My_center", "Mz_center"]
+        history = np.empty(n_steps+1, dtype=[(k, np.float64) for k in names])
+        for i, k in enumerate(names):
+            history[k] = raw_history[:, i]
+        return history
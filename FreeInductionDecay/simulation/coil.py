@@ -1,9 +1,36 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from scipy import integrate
+from numba import njit, prange
 from ..units import *
 
+@njit(parallel=True, cache=True, fastmath=True)
+def _biot_savart(lx, ly, lz, dlx, dly, dlz, weights, x, y, z, out):
+    """Line integral of the Biot-Savart law along a wire for many points.
+
+    out[:, i] = sum_k weights[k] * dL_k × r_ik / |r_ik|³,  r_ik = (x_i, y_i, z_i) - L_k
+
+    with the wire positions L_k = (lx, ly, lz)[k], the tangents
+    dL_k = (dlx[k], dly[k], dlz) and the quadrature weights `weights`. The
+    integrand is evaluated and summed in one pass, parallelized over points.
+    """
+    for i in prange(x.shape[0]):
+        bx = 0.
+        by = 0.
+        bz = 0.
+        for k in range(lx.shape[0]):
+            rx = x[i] - lx[k]
+            ry = y[i] - ly[k]
+            rz = z[i] - lz[k]
+            r2 = rx*rx + ry*ry + rz*rz
+            w = weights[k]/(r2*np.sqrt(r2))
+            bx += (dly[k]*rz - dlz*ry)*w
+            by += (dlz*rx - dlx[k]*rz)*w
+            bz += (dlx[k]*ry - dly[k]*rx)*w
+        out[0, i] = bx
+        out[1, i] = by
+        out[2, i] = bz
+
 class Coil(object):
     r"""A coil parametrized by number of turns, length, diameter and current.
 
@@ -24,6 +51,20 @@ class Coil(object):
         self.current = current
         self.use_biot_savart = use_biot_savart
 
+        # parametrization of the helix and its tangent dL/dphi, odd number of
+        # points, such that Simpson's rule covers the grid
+        self._phi, self._dphi = np.linspace(0, 2*np.pi*self.turns, 10001, retstep=True)
+        self._lx = self.radius*np.sin(self._phi)
+        self._ly = self.radius*np.cos(self._phi)
+        self._lz = self.length/2 * (self._phi/(np.pi*self.turns)-1)
+        self._dlx = self._ly
+        self._dly = -self._lx
+        self._dlz = self.length/(2*np.pi*self.turns)
+        # weights of Simpson's rule on the uniform grid
+        self._weights = np.full(len(self._phi), 2*self._dphi/3)
+        self._weights[1::2] = 4*self._dphi/3
+        self._weights[[0, -1]] = self._dphi/3
+
     def B_field(self, x, y, z):
         r"""The magnetic field of the coil
         Assume Biot-Savart law
@@ -42,27 +83,34 @@ class Coil(object):
             - constant current, can factor out the I from integral
         """
 
-        phi = np.linspace(0, 2*np.pi*self.turns, 10000)
-        sPhi = np.sin(phi)
-        cPhi = np.cos(phi)
-        lx = self.radius*sPhi
-        ly = self.radius*cPhi
-        lz = self.length/2 * (phi/(np.pi*self.turns)-1)
-        dlx = ly
-        dly = -lx
-        dlz = self.length/(2*np.pi*self.turns)
+        B_x, B_y, B_z = self.B_field_many(x, y, z)
+        return [B_x, B_y, B_z]
 
-        dist = np.sqrt((lx-x)**2+(ly-y)**2+(lz-z)**2)
+    def B_field_many(self, xs, ys, zs):
+        r"""The magnetic field of the coil evaluated at many points at once.
 
-        integrand_x = ( dly * (z-lz) - dlz * (y-ly) ) / dist**3
-        integrand_y = ( dlz * (x-lx) - dlx * (z-lz) ) / dist**3
-        integrand_z = ( dlx * (y-ly) - dly * (x-lx) ) / dist**3
+        The parametrization of the helix is calculated once in the
+        constructor, the Biot-Savart integral is evaluated for all points in
+        a compiled kernel, see `_biot_savart`.
 
-        B_x = mu0/(4*np.pi) * self.current * integrate.simps(integrand_x, x=phi)
-        B_y = mu0/(4*np.pi) * self.current * integrate.simps(integrand_y, x=phi)
-        B_z = mu0/(4*np.pi) * self.current * integrate.simps(integrand_z, x=phi)
+        Parameters:
+        * xs, ys, zs: float or array, positions
 
-        return [B_x, B_y, B_z]
+        Returns:
+        * B_x, B_y, B_z: arrays with the shape of the broadcasted positions,
+              floats for scalar positions
+        """
+        xs, ys, zs = np.broadcast_arrays(xs, ys, zs)
+        shape = xs.shape
+        xs, ys, zs = [np.ascontiguousarray(v, dtype=float).ravel() for v in (xs, ys, zs)]
+
+        B = np.empty((3, len(xs)))
+        _biot_savart(self._lx, self._ly, self._lz, self._dlx, self._dly,
+                     self._dlz, self._weights, xs, ys, zs, B)
+        B *= mu0/(4*np.pi) * self.current
+
+        # indexing with () turns 0-d results into scalars
+        return B[0].reshape(shape)[()], B[1].reshape(shape)[()], B[2].reshape(shape)[()]
 
     def Bz(self, z):
         """ This is an analytical solution for the B_z component along the x=y=0
@@ -72,6 +120,6 @@ class Coil(object):
         n = self.turns / self.length
         I = self.current
         L = self.length
-        R = self.coil.radius
+        R = self.radius
         B_z = lambda z: mu0*n*I/2*((z+L/2)/np.sqrt(R**2+(z+L/2)**2)-(z-L/2)/np.sqrt(R**2+(z-L/2)**2))
         return B_z(z)
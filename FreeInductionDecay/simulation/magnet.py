@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 from ..units import *
 
 class RingMagnet(object):
@@ -52,55 +53,84 @@ class RingMagnet(object):
                   23: 0*T/mm**3,
                   24: 0*T/mm**3,
                  }
+        # field evaluation generated by `compile` for the strengths in An
+        self._compiled = None
+
+    # components (x, y, z) of the shape function of each multipole as source
+    # code, used to generate the field evaluation in `compile`
+    _SHAPES = { # dipoles
+                1: ("1", "0", "0"),
+                2: ("0", "1", "0"),
+                3: ("1", "0", "1"),
+                # quadrupoles
+                4: ("x", "-y", "0"),
+                5: ("z", "0", "x"),
+                6: ("0", "-y", "z"),
+                7: ("y", "x", "0"),
+                8: ("0", "z", "y"),
+                # sextupoles
+                9: ("x*x - y*y", "-2*x*y", "0"),
+               10: ("2*x*z", "-2*y*z", "x*x - y*y"),
+               11: ("z*z - y*y", "-2*x*y", "2*x*y"),
+               12: ("0", "-2*y*z", "z*z - y*y"),
+               13: ("2*x*y", "x*x - y*y", "0"),
+               14: ("y*z", "x*z", "x*y"),
+               15: ("0", "z*z - y*y", "2*y*z"),
+               # octupoles
+               16: ("x*(x*x - 3*y*y)", "y*(y*y - 3*x*x)", "0"),
+               17: ("3*z*(x*x - y*y)", "-6*x*y*z", "x*(x*x - 3*y*y)"),
+               18: ("3*x*(z*z - y*y)", "y*(2*y*y - 3*x*x - 3*z*z)", "3*z*(x*x - y*y)"),
+               19: ("z*(z*z - 3*y*y)", "-6*x*y*z", "3*x*(z*z - y*y)"),
+               20: ("0", "y*(y*y - 3*z*z)", "z*(z*z - 3*y*y)"),
+               21: ("y*(3*x*x - y*y)", "x*(x*x - 3*y*y)", "0"),
+               22: ("6*x*y*z", "3*z*(x*x - y*y)", "y*(3*x*x - y*y)"),
+               23: ("y*(3*z*z - y*y)", "3*x*(z*z - y*y)", "6*x*y*z"),
+               24: ("0", "z*(z*z - 3*y*y)", "y*(3*z*z - y*y)"),
+              }
+
+    def compile(self):
+        """Generates a function f(x, y, z) evaluating the magnetic field for
+        the current multipole strengths, which only contains the terms of the
+        multipoles with non vanishing strength.
+
+        The function is cached and only regenerated if `An` was changed.
 
-        self.P = { # dipoles
-                   1: {"x": lambda x, y, z: 1, "y": lambda x, y, z: 0, "z": lambda x, y, z: 0},
-                   2: {"x": lambda x, y, z: 0, "y": lambda x, y, z: 1, "z": lambda x, y, z: 0},
-                   3: {"x": lambda x, y, z: 1, "y": lambda x, y, z: 0, "z": lambda x, y, z: 1},
-                   # quadrupoles
-                   4: {"x": lambda x, y, z: x, "y": lambda x, y, z: -y, "z": lambda x, y, z: 0},
-                   5: {"x": lambda x, y, z: z, "y": lambda x, y, z: 0, "z": lambda x, y, z: x},
-                   6: {"x": lambda x, y, z: 0, "y": lambda x, y, z: -y, "z": lambda x, y, z: z},
-                   7: {"x": lambda x, y, z: y, "y": lambda x, y, z: x, "z": lambda x, y, z: 0},
-                   8: {"x": lambda x, y, z: 0, "y": lambda x, y, z: z, "z": lambda x, y, z: y},
-                   # sextupoles
-                   9: {"x": lambda x, y, z: x**2-y**2, "y": lambda x, y, z: -2*x*y, "z": lambda x, y, z: 0},
-                  10: {"x": lambda x, y, z: 2*x*z, "y": lambda x, y, z: -2*y*z, "z": lambda x, y, z: x**2-y**2},
-                  11: {"x": lambda x, y, z: z**2-y**2, "y": lambda x, y, z: -2*x*y, "z": lambda x, y, z: 2*x*y},
-                  12: {"x": lambda x, y, z: 0, "y": lambda x, y, z: -2*y*z, "z": lambda x, y, z: z**2-y**2},
-                  13: {"x": lambda x, y, z: 2*x*y, "y": lambda x, y, z: x**2-y**2, "z": lambda x, y, z: 0},
-                  14: {"x": lambda x, y, z: y*z, "y": lambda x, y, z: x*z, "z": lambda x, y, z: x*y},
-                  15: {"x": lambda x, y, z: 0, "y": lambda x, y, z: z**2-y**2, "z": lambda x, y, z: 2*y*z},
-                  # octupole
-                  16: {"x": lambda x, y, z: x**3 - 3*x*y**2, "y": lambda x, y, z: y**3-3*x**2*y, "z": lambda x, y, z: 0},
-                  17: {"x": lambda x, y, z: 3*x**2*z-3*z*y**2, "y": lambda x, y, z: -6*x*y*z, "z": lambda x, y, z: x**3 - 3*x*y**2},
-                  18: {"x": lambda x, y, z: 3*x*z**2-3*x*y**2, "y": lambda x, y, z: -3*x**2*y-3*z**2*y+2*y**3, "z": lambda x, y, z: 3*x**2*z-3*z*y**2},
-                  19: {"x": lambda x, y, z: z**3-3*z*y**2, "y": lambda x, y, z: -6*x*y*z, "z": lambda x, y, z: 3*x*z**2 - 3*x*y**2},
-                  20: {"x": lambda x, y, z: 0, "y": lambda x, y, z: y**3-3*z**2*y, "z": lambda x, y, z: z**3-3*z*y**2},
-                  21: {"x": lambda x, y, z: 3*x**2*y-y**3, "y": lambda x, y, z: x**3-3*x*y**2, "z": lambda x, y, z: 0},
-                  22: {"x": lambda x, y, z: 6*x*y*z, "y": lambda x, y, z: 3*x**2*z-3*z*y**2, "z": lambda x, y, z: 3*x**2*y-y**3},
-                  23: {"x": lambda x, y, z: 3*z**2*y-y**3, "y": lambda x, y, z: 3*x*z**2-3*x*y**2, "z": lambda x, y, z: 6*x*y*z},
-                  24: {"x": lambda x, y, z: 0, "y": lambda x, y, z: z**3-3*z*y**2, "z": lambda x, y, z: 3*z**2*y-y**3},
-                 }
+        Returns:
+        * function of x, y, z returning Bx, By, Bz
+        """
+        An = tuple(self.An[i] for i in sorted(self._SHAPES))
+        if self._compiled is not None and self._compiled[0] == An:
+            return self._compiled[1]
+
+        components = []
+        for k in range(3):
+            terms = ["An[%i]*(%s)" % (i, shape[k])
+                     for i, shape in sorted(self._SHAPES.items())
+                     if self.An[i] != 0 and shape[k] != "0"]
+            # indexing with () turns 0-d results into scalars
+            components.append("(%s)[()]" % " + ".join(["zero"] + terms))
+        src = ("def B_field(x, y, z):\n"
+               "    x, y, z = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (x, y, z)])\n"
+               "    zero = np.zeros_like(x)\n"
+               "    return %s, %s, %s\n" % tuple(components))
+        namespace = {"np": np, "An": dict(self.An)}
+        exec(src, namespace)
+        self._compiled = (An, namespace["B_field"])
+        return self._compiled[1]
 
     def B_field(self, x=0, y=0, z=0):
         """Evaluates magnetic field at position x, y, z
 
         Parameters:
-        * x: float, x position
-        * y: float, y position
-        * z: float, z position
+        * x: float or array, x position
+        * y: float or array, y position
+        * z: float or array, z position
 
         Returns:
-        * array of length 3,  Magnetic field at position (x,y,z)
+        * array of length 3,  Magnetic field at position (x,y,z). If arrays
+          of positions are given each entry is an array of the same shape.
         """
-        Bx = 0
-        By = 0
-        Bz = 0
-        for i in self.P.keys():
-            Bx += self.An[i]*self.P[i]["x"](x, y, z)
-            By += self.An[i]*self.P[i]["y"](x, y, z)
-            Bz += self.An[i]*self.P[i]["z"](x, y, z)
+        Bx, By, Bz = self.compile()(x, y, z)
         return [Bx, By, Bz]
 
     def __call__(self, x=0, y=0, z=0):
@@ -116,6 +146,47 @@ class RingMagnet(object):
         """
         return self.B_field(x, y, z)
 
+    # type and order (the strength has units of B0/length^order) of the
+    # multipoles 1 - 24, index 0 is unused
+    _NAMES = (None,) + ("Dipole",)*3 + ("Quadrupole",)*5 + ("Sextupole",)*7 + ("Octupole",)*9
+    _ORDERS = (None,) + (0,)*3 + (1,)*5 + (2,)*7 + (3,)*9
+    # unit of the strength, opens the math mode for the shape of the multipole
+    _UNIT_STR = ("$", "/cm$", "/cm$^2", "/cm$^3")
+    _VECTOR_STR = (None,
+                   "(1, 0, 0)",
+                   "(0, 1, 0)",
+                   "(0, 0, 1)",
+
+                   "(x, -y, 0)",
+                   "(z, 0, x)",
+                   "(0, -y, z)",
+                   "(y, x, 0)",
+                   "(0, z, y)",
+
+                   "(x^2-y^2, -2xy, 0)",
+                   "(2xz, -2yz, x^2-y^2)",
+                   "(z^2-y^2, -2xy, 2xy)",
+                   "(0, -2yz, z^2-y^2)",
+                   "(2xy, x^2-y^2, 0)",
+                   "(yz, xz, xy)",
+                   "(0, z^2-y^2, 2yz)",
+
+                   "(x^3-3xy^2, y^3-3x^2y,0)",
+                   "(3x^2z-3zy^2, -6xyz, x^3 - 3xy^2)",
+                   "(3xz^2-3xy^2, -3x^2y-3z^2y+2y^3, 3x^2z-3zy^2)",
+                   "(z^3-3zy^2, -6xyz, 3xz^2 - 3xy^2)",
+                   "(0, y^3-3z^2y, z^3-3zy^2)",
+                   "(3x^2y-y^3, x^3-3xy^2, 0)",
+                   "(6xyz, 3x^2z-3zy^2, 3x^2y-y^3)",
+                   "(3z^2y-y^3, 3xz^2-3xy^2, 6xyz)",
+                   "(0, z^3-3zy^2, 3z^2y-y^3)",
+                  )
+
+    @staticmethod
+    def _check_multipole(multipole):
+        if multipole < 1 or multipole > 24:
+            raise ValueError("Multipoles are only defined for index 1 to 24.")
+
     def strength_to_str(self, multipole, strength):
         """Pretty string for multipole strength.
 
@@ -126,23 +197,14 @@ class RingMagnet(object):
         Returns:
         * string giving type, of multipole, strength of gradient and shape of multipole
         """
+        self._check_multipole(multipole)
         str = "%.1f ppm"%(strength/ppm)
         if strength < 1*ppm:
             str = "%.1f ppb"%(strength/ppb)
 
         vec = self.multipole_vector_str(multipole)
-
-        if 1<=multipole and multipole <= 3:
-            return "Dipole: %s$\cdot %s^T$"%(str, vec)
-
-        if 4<=multipole and multipole <= 8:
-            return "Quadrupole: %s/cm$\cdot %s^T$"%(str, vec)
-
-        if 9<=multipole and multipole <= 15:
-            return "Sextupole: %s/cm$^2\cdot %s^T$"%(str, vec)
-
-        if 16<=multipole and multipole <= 24:
-            return "Octupole: %s/cm$^3\cdot %s^T$"%(str, vec)
+        unit = self._UNIT_STR[self._ORDERS[multipole]]
+        return "%s: %s%s\cdot %s^T$"%(self._NAMES[multipole], str, unit, vec)
 
     def multipole_vector_str(self, multipole):
         """String representation of a multipole
@@ -153,33 +215,8 @@ class RingMagnet(object):
         Returns:
         * string, shape of multipole
         """
-        if multipole==1: return "(1, 0, 0)"
-        if multipole==2: return "(0, 1, 0)"
-        if multipole==3: return "(0, 0, 1)"
-
-        if multipole==4: return "(x, -y, 0)"
-        if multipole==5: return "(z, 0, x)"
-        if multipole==6: return "(0, -y, z)"
-        if multipole==7: return "(y, x, 0)"
-        if multipole==8: return "(0, z, y)"
-
-        if multipole==9: return "(x^2-y^2, -2xy, 0)"
-        if multipole==10: return "(2xz, -2yz, x^2-y^2)"
-        if multipole==11: return "(z^2-y^2, -2xy, 2xy)"
-        if multipole==12: return "(0, -2yz, z^2-y^2)"
-        if multipole==13: return "(2xy, x^2-y^2, 0)"
-        if multipole==14: return "(yz, xz, xy)"
-        if multipole==15: return "(0, z^2-y^2, 2yz)"
-
-        if multipole==16: return "(x^3-3xy^2, y^3-3x^2y,0)"
-        if multipole==17: return "(3x^2z-3zy^2, -6xyz, x^3 - 3xy^2)"
-        if multipole==18: return "(3xz^2-3xy^2, -3x^2y-3z^2y+2y^3, 3x^2z-3zy^2)"
-        if multipole==19: return "(z^3-3zy^2, -6xyz, 3xz^2 - 3xy^2)"
-        if multipole==20: return "(0, y^3-3z^2y, z^3-3zy^2)"
-        if multipole==21: return "(3x^2y-y^3, x^3-3xy^2, 0)"
-        if multipole==22: return "(6xyz, 3x^2z-3zy^2, 3x^2y-y^3)"
-        if multipole==23: return "(3z^2y-y^3, 3xz^2-3xy^2, 6xyz)"
-        if multipole==24: return "(0, z^3-3zy^2, 3z^2y-y^3)"
+        self._check_multipole(multipole)
+        return self._VECTOR_STR[multipole]
 
     def multipole_name(self, multipole):
         """Returns type of multipole as string
@@ -190,15 +227,8 @@ class RingMagnet(object):
         Returns:
         * string, type of multipole
         """
-        if 1 <= multipole and multipole <= 3:
-            return "Dipole"
-        if 4 <= multipole and multipole <= 8:
-            return "Quadrupole"
-        if 9 <= multipole and multipole <= 15:
-            return "Sextupole"
-        if 16 <= multipole and multipole <= 24:
-            return "Octupole"
-        raise ValueError("Multipoles are only defined for index 1 to 24.")
+        self._check_multipole(multipole)
+        return self._NAMES[multipole]
 
     def set_strength_at_1cm(self, multipole, strength):
         """Calculates DeltaB from multipole at 1 cm distance. Takes different
@@ -208,13 +238,5 @@ class RingMagnet(object):
         * multipole: int, number of multipole, allowed range 1 - 24
         * strength: float, strength of gradient
         """
-
-        if  multipole < 1 or multipole > 24:
-            raise ValueError("Multipoles are only defined for index 1 to 24.")
-        elif 4 <= multipole and multipole <= 8:
-            strength /= cm
-        elif 9 <= multipole and multipole <= 15:
-            strength /= cm**2
-        elif 16 <= multipole and multipole <= 24:
-            strength /= cm**3
-        self.An[multipole] = strength*self.An[2]
+        self._check_multipole(multipole)
+        self.An[multipole] = strength/cm**self._ORDERS[multipole]*self.An[2]
@@ -2,8 +2,13 @@
 import numpy as np
 try:
     import scipy.fft as fftpack
+    from scipy.fft import next_fast_len
 except:
-    import scipy.fftpack as fftpack
+    # scipy.fftpack.rfft uses a different output format, numpy.fft has the
+    # same interface as scipy.fft
+    import numpy.fft as fftpack
+    def next_fast_len(target, real=False):
+        return target
 
 
 class Noise(object):
@@ -41,17 +46,37 @@ class FreqNoise(Noise):
         super(FreqNoise, self).__init__(rng)
         self.power = power
         self.scale = scale
+        # spectral shape of the last time series, see `_spectral_shape`
+        self._shape = None
+
+    def _spectral_shape(self, N_fft, d):
+        """Returns the factors f^(power/2) the spectrum of white noise of
+        length `N_fft` and sampling interval `d` is multiplied with.
+
+        The factors are kept for the next call, such that repeated noise draws
+        for the same times do not evaluate the power again.
+        """
+        key = (N_fft, d, self.power)
+        if self._shape is None or self._shape[0] != key:
+            # the noise is real, so only the non negative frequencies are needed
+            freq = fftpack.rfftfreq(N_fft, d=d)
+            shape = np.empty(len(freq))
+            # the DC bin is the first one of rfftfreq
+            shape[0] = 0
+            shape[1:] = np.power(freq[1:], self.power/2.)
+            self._shape = (key, shape)
+        return self._shape[1]
 
     def __call__(self, times, rng=None):
         if rng is None: rng = self.rng
         N = len(times)
-        white = rng.normal(loc=0.0, scale=self.scale, size=N)
-        freq = fftpack.fftfreq(N, d=times[1]-times[0])
-        fft  = fftpack.fft(white)
-        fft[freq!=0] *= np.power(np.abs(freq[freq!=0]), self.power/2.)
-        fft[freq==0] = 0
-        noise = fftpack.ifft(fft)
-        return np.real(noise)
+        # FFTs are fastest for lengths with small prime factors only, so the
+        # noise is generated for such a length and cut to N samples
+        N_fft = next_fast_len(N, real=True)
+        white = rng.normal(loc=0.0, scale=self.scale, size=N_fft)
+        fft  = fftpack.rfft(white)
+        fft *= self._spectral_shape(N_fft, times[1]-times[0])
+        return fftpack.irfft(fft, n=N_fft)[:N]
 
 class LinearDrift(Noise):
     def __init__(self, scale, rng=None):
@@ -29,16 +29,20 @@ class NMRProbe(object):
         """Calculates the probes magnetization for a given B field value.
         B_field can be an array, in which case magnetization for each entry are calculated"""
         expon = self.material.magnetic_moment / (kB*self.temp) * B_field
-        nuclear_polarization = (np.exp(expon) - np.exp(-expon))/(np.exp(expon) + np.exp(-expon))
+        nuclear_polarization = np.tanh(expon)
         magnetizations = self.material.magnetic_moment * self.material.number_density * nuclear_polarization
         return magnetizations
 
     def random_samples(self, rng, size):
-        r = np.sqrt(rng.uniform(0,self.radius**2, size=size))
-        phi = rng.uniform(0, 2*np.pi, size=size)
+        """Draws `size` points uniformly distributed in the sample volume.
+        rng can be a np.random.Generator or a np.random.RandomState, all
+        random numbers are drawn in one batch."""
+        u = rng.uniform(size=(3, size))
+        r = self.radius*np.sqrt(u[0])
+        phi = 2*np.pi*u[1]
         x = r*np.sin(phi)
         y = r*np.cos(phi)
-        z = rng.uniform(-self.length/2., self.length/2., size=size)
+        z = self.length*(u[2] - 0.5)
         return x, y, z
 
     def estimate_rf_pulse(self, alpha=np.pi/2):
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from .context import unittest
+
+import copy
+import numpy as np
+from scipy.integrate import solve_ivp
+from FreeInductionDecay.units import mu0, us
+from FreeInductionDecay.simulation.E989 import StorageRingMagnet, FixedProbe
+from FreeInductionDecay.simulation.FID_sim import FID_simulation
+
+class TestBlochIntegration(unittest.TestCase):
+    """The fixed step Runge-Kutta 4 integration of solve_bloch_eq_nummerical
+    is compared to an adaptive high order integration of the same Bloch
+    equations."""
+
+    def setUp(self):
+        self.sim = FID_simulation(FixedProbe(), StorageRingMagnet(), N_cells=20, seed=1)
+        self.omega_rf = 2*np.pi*self.sim.probe.rf_pulse_frequency
+        self.time = 0.1*us
+
+    def reference(self, with_self_contribution, with_relaxation):
+        sim = self.sim
+        material = sim.probe.material
+        gamma = material.gyromagnetic_ratio
+        B0 = np.array([sim.cells_B0_x, sim.cells_B0_y, sim.cells_B0_z])
+        B1 = np.array([sim.cells_B1_x, sim.cells_B1_y, sim.cells_B1_z])
+        mag = mu0*sim.cells_magnetization
+
+        def rhs(t, M):
+            M = M.reshape(3, -1)
+            B = B0 + np.sin(self.omega_rf*t)*B1
+            if with_self_contribution:
+                B = B + mag*M
+            dM = gamma*np.cross(M, B, axis=0)
+            if with_relaxation:
+                dM[0] -= M[0]/material.T2
+                dM[1] -= (M[1] - 1)/material.T1
+                dM[2] -= M[2]/material.T2
+            return dM.ravel()
+
+        M0 = np.array([sim.cells_mu.x, sim.cells_mu.y, sim.cells_mu.z])
+        solution = solve_ivp(rhs, (0, self.time), M0.ravel(), method="DOP853",
+                             rtol=1e-12, atol=1e-12)
+        return solution.y[:, -1].reshape(3, -1)
+
+    def check(self, with_self_contribution, with_relaxation):
+        expected = self.reference(with_self_contribution, with_relaxation)
+        history = self.sim.solve_bloch_eq_nummerical(time=self.time,
+                        omega_rf=self.omega_rf,
+                        with_self_contribution=with_self_contribution,
+                        with_relaxation=with_relaxation)
+        # the state of the cells is stored as unit vectors
+        M = np.array([self.sim.cells_mu.x, self.sim.cells_mu.y, self.sim.cells_mu.z])
+        np.testing.assert_allclose(M, expected/np.linalg.norm(expected, axis=0),
+                                   rtol=0, atol=1e-6)
+        self.assertAlmostEqual(history["time"][-1], self.time, delta=1e-9*self.time)
+        np.testing.assert_allclose(history["Mx_mean"][-1],
+                                   np.average(expected[0], weights=self.sim.cells_B1),
+                                   rtol=0, atol=1e-6)
+
+    def test_precession(self):
+        self.check(with_self_contribution=False, with_relaxation=False)
+
+    def test_self_contribution_and_relaxation(self):
+        self.check(with_self_contribution=True, with_relaxation=True)
+
+    def test_float32(self):
+        # a full pi/2 pulse in single precision agrees with double precision
+        # at the level documented in solve_bloch_eq_nummerical
+        pulse = self.sim.probe.estimate_rf_pulse()
+        states = []
+        for dtype in (np.float64, np.float32):
+            sim = copy.deepcopy(self.sim)
+            history = sim.solve_bloch_eq_nummerical(time=pulse,
+                                                    omega_rf=self.omega_rf,
+                                                    dtype=dtype)
+            for component in (sim.cells_mu.x, sim.cells_mu.y, sim.cells_mu.z, sim.cells_mu.phase):
+                self.assertEqual(component.dtype, np.float64)
+            states.append((np.array([sim.cells_mu.x, sim.cells_mu.y, sim.cells_mu.z]),
+                           history["Mx_mean"]))
+        (M64, Mx64), (M32, Mx32) = states
+        np.testing.assert_allclose(M32, M64, rtol=0, atol=2e-4)
+        np.testing.assert_allclose(Mx32, Mx64, rtol=0, atol=2e-4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from .context import unittest
+
+import numpy as np
+from FreeInductionDecay.simulation.FID_sim import (finufft, _PICKUP_CELL_BLOCK,
+    _pickup_tile_length, _pickup_flux_kernel, _pickup_flux_phasor_kernel,
+    _pickup_flux_nufft)
+
+class TestPickupFluxPaths(unittest.TestCase):
+    """generate_FID chooses one of three flux kernels depending on the time
+    grid, the problem size and whether finufft is installed. All of them have
+    to give the same flux."""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        N_cells = 500
+        # mixed down frequencies of the cells around 50 kHz
+        self.omega = 2*np.pi*(50e3 + rng.normal(0, 100, N_cells))
+        self.phase = rng.uniform(-np.pi, np.pi, N_cells)
+        self.mag = rng.uniform(0.5, 1.5, N_cells)
+        self.wx = rng.normal(0, 0.1, N_cells)
+        self.wz = rng.normal(1, 0.1, N_cells)
+        self.cplx = self.mag*(self.wx - 1j*self.wz)*np.exp(-1j*self.phase)
+        # equidistant grid, such that all three kernels can be used
+        self.t = np.arange(4000)*1e-6
+
+        self.direct = np.empty(len(self.t))
+        _pickup_flux_kernel(self.t, self.omega, self.phase, self.mag,
+                            self.wx, self.wz, _PICKUP_CELL_BLOCK, self.direct)
+        self.scale = np.max(np.abs(self.direct))
+
+    def test_phasor_kernel(self):
+        dt = self.t[1] - self.t[0]
+        flux = np.empty(len(self.t))
+        _pickup_flux_phasor_kernel(self.t, self.omega,
+                                   np.exp(1j*self.omega*dt), self.cplx,
+                                   _pickup_tile_length(len(self.t)), flux)
+        np.testing.assert_allclose(flux, self.direct, rtol=0, atol=1e-9*self.scale)
+
+    @unittest.skipIf(finufft is None, "finufft is not installed")
+    def test_nufft(self):
+        flux = np.empty(len(self.t))
+        _pickup_flux_nufft(self.t, self.omega, self.cplx, flux)
+        np.testing.assert_allclose(flux, self.direct, rtol=0, atol=1e-9*self.scale)
+
+if __name__ == '__main__':
+    unittest.main()